@@ -9,7 +9,8 @@ Date: January 30, 2025
 
 import streamlit as st
 import pandas as pd
-from datetime import datetime, timedelta
+import numpy as np
+from datetime import datetime
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -17,6 +18,16 @@ import io
 import base64
 from pathlib import Path
 import json
+import hashlib
+import threading
+import re
+import functools
+from pandas.tseries.api import guess_datetime_format
+
+try:
+    import ciso8601
+except ImportError:
+    ciso8601 = None
 
 # Page configuration
 st.set_page_config(
@@ -27,7 +38,7 @@ st.set_page_config(
 )
 
 # Custom CSS for beautiful design
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main {
         padding: 2rem;
@@ -83,68 +94,260 @@ st.markdown("""
         margin-bottom: 2rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+
+def _open_excel(file_bytes):
+    """Open a workbook with the calamine engine, falling back to openpyxl."""
+    try:
+        return pd.ExcelFile(io.BytesIO(file_bytes), engine='calamine')
+    except ImportError:
+        return pd.ExcelFile(io.BytesIO(file_bytes), engine='openpyxl')
+
+
+@st.cache_data(show_spinner=False, max_entries=32, ttl=3600)
+def _parse_sheet(_excel_data, file_key, sheet_name):
+    """Parse one sheet of an open workbook, cached on the file digest."""
+    return _excel_data.parse(sheet_name)
+
+
+@functools.lru_cache(maxsize=256)
+def _sniff_format(sample):
+    """Guess the strftime format shared by a tuple of date strings, if any."""
+    formats = {guess_datetime_format(value) for value in sample}
+    if len(formats) == 1:
+        return formats.pop()
+    return None
+
+
+def _parse_iso(value):
+    """Parse one ISO 8601 string with ciso8601, or None if it is not one."""
+    try:
+        return ciso8601.parse_datetime_as_naive(value)
+    except ValueError:
+        return None
+
+
+def _fast_to_datetime(series):
+    """Convert a column to datetime using one explicit format where possible."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_datetime(series.astype('int64'), unit='s', errors='coerce', cache=True)
+    
+    # Lot-level expiry dates repeat a lot; parse each distinct value once
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Series(uniques, dtype=object)
+    
+    sample = tuple(value for value in uniques.iloc[:5] if isinstance(value, str))
+    fmt = _sniff_format(sample) if sample else None
+    converted = pd.to_datetime(uniques, format=fmt or 'mixed', errors='coerce')
+    
+    # Retry strings the sniffed format rejected with the ISO 8601 parser
+    if ciso8601 is not None and converted.isna().any():
+        failed = converted.isna() & uniques.map(lambda value: isinstance(value, str))
+        converted[failed] = pd.to_datetime(uniques[failed].map(_parse_iso), errors='coerce')
+    
+    # Map the parsed values back onto the rows; missing cells become NaT
+    return pd.Series(converted.array.take(codes, allow_fill=True), index=series.index, name=series.name)
+
+
+def _smtp_alive(server):
+    """Liveness probe for a cached SMTP connection."""
+    try:
+        return server.noop()[0] == 250
+    except (smtplib.SMTPException, OSError):
+        return False
+
+
+def _connect_smtp(smtp_server, smtp_port, sender_email, sender_password):
+    """Open a logged-in SMTP connection."""
+    server = smtplib.SMTP(smtp_server, smtp_port)
+    try:
+        server.starttls()
+        server.login(sender_email, sender_password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def _close_smtp(server):
+    """Close an SMTP connection that may already be dead."""
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def _smtp_account_key(smtp_server, smtp_port, sender_email, sender_password):
+    """Digest identifying an SMTP account without keeping its password around."""
+    account = '\0'.join([smtp_server, str(smtp_port), sender_email, sender_password])
+    return hashlib.sha256(account.encode()).hexdigest()
+
+
+def _smtp_slot_usable(slot):
+    """A slot whose reconnect failed is dropped from the cache."""
+    return slot['server'] is not None
+
+
+@st.cache_resource(show_spinner=False, validate=_smtp_slot_usable)
+def _smtp_slot(account_key, _smtp_server, _smtp_port, _sender_email, _sender_password):
+    """Shared SMTP connection for one account and the lock guarding it.
+    
+    Connects up front so a failed login leaves nothing cached.
+    """
+    server = _connect_smtp(_smtp_server, _smtp_port, _sender_email, _sender_password)
+    return {'server': server, 'lock': threading.Lock()}
+
+
+def _send_smtp(msg, smtp_server, smtp_port, sender_email, sender_password):
+    """Send msg over the account's cached connection, reconnecting if it went stale."""
+    account_key = _smtp_account_key(smtp_server, smtp_port, sender_email, sender_password)
+    
+    while True:
+        slot = _smtp_slot(account_key, smtp_server, smtp_port, sender_email, sender_password)
+        
+        # smtplib is not thread-safe; sessions sharing an account take turns
+        with slot['lock']:
+            if slot['server'] is None:
+                # Another session discarded this slot while we waited
+                continue
+            
+            # A failed reconnect leaves server as None, so the slot is discarded
+            if not _smtp_alive(slot['server']):
+                _close_smtp(slot['server'])
+                slot['server'] = None
+                slot['server'] = _connect_smtp(smtp_server, smtp_port, sender_email, sender_password)
+            
+            try:
+                slot['server'].send_message(msg)
+            except smtplib.SMTPServerDisconnected:
+                # Connection dropped since the liveness check; reconnect once
+                slot['server'].close()
+                slot['server'] = None
+                slot['server'] = _connect_smtp(smtp_server, smtp_port, sender_email, sender_password)
+                slot['server'].send_message(msg)
+            return
+
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def _build_excel_report(_items, report_key):
+    """Excel report bytes for a list of expiring items, cached on report_key."""
+    df_report = pd.DataFrame(_items)
+    if 'additional_info' in df_report:
+        df_report['additional_info'] = df_report['additional_info'].astype(str)
+    
+    output = io.BytesIO()
+    # constant_memory flushes each row once the next one starts, so rows are
+    # written in order here; DataFrame.to_excel writes column by column
+    with pd.ExcelWriter(output, engine='xlsxwriter',
+                        engine_kwargs={'options': {'constant_memory': True}}) as writer:
+        worksheet = writer.book.add_worksheet('Expiring Items')
+        worksheet.write_row(0, 0, df_report.columns, writer.book.add_format({'bold': True}))
+        for row_idx, values in enumerate(df_report.itertuples(index=False, name=None), start=1):
+            worksheet.write_row(row_idx, 0, values)
+    
+    return output.getvalue()
+
+
+@st.cache_data(show_spinner=False, max_entries=16, ttl=3600)
+def _build_csv_report(_items, report_key):
+    """CSV report text for a list of expiring items, cached on report_key."""
+    return pd.DataFrame(_items).to_csv(index=False)
 
 
 class ExpiryCheckerApp:
     """Main application class for the Streamlit web platform."""
     
+    DATE_RE = re.compile(
+        r'(expir|valid|use by|best before|shelf life|due date|end date|date)', re.I
+    )
+    SNIFF_ROWS = 100
+    
+    ITEM_KEYWORDS = ['name', 'item', 'product', 'reagent', 'chemical', 'material', 'description']
+    
+    ADDITIONAL_KEYWORDS = {
+        'lot': ['lot', 'batch', 'lot number', 'batch number'],
+        'catalog': ['catalog', 'cat#', 'cat no', 'catalogue'],
+        'quantity': ['quantity', 'qty', 'amount', 'volume', 'vol'],
+        'location': ['location', 'storage', 'position', 'shelf', 'cabinet'],
+        'supplier': ['supplier', 'vendor', 'manufacturer', 'company']
+    }
+    
+    URGENCY_LEVELS = ['expired', 'critical', 'urgent', 'warning', 'info']
+    
+    BADGE_TEXT = {
+        'critical': '🔴 CRITICAL',
+        'urgent': '🟠 URGENT',
+        'warning': '🟡 WARNING'
+    }
+    
+    REPORT_COLUMNS = ['sheet', 'item', 'expiry_date', 'days_left', 'urgency', 'additional_info']
+    
     def __init__(self):
         self.expiring_items = []
+        self._df = pd.DataFrame(columns=self.REPORT_COLUMNS)
+        self.report_key = None
+        self.urgency_counts = {}
         self.stats = {
             'total_rows': 0,
             'sheets_processed': 0,
             'items_found': 0
         }
     
-    def detect_date_columns(self, df):
-        """Detect columns containing expiry dates."""
-        date_keywords = [
-            'expiry', 'expiration', 'expire', 'expires', 'expiring',
-            'valid', 'validity', 'valid until', 'valid till',
-            'use by', 'best before', 'shelf life', 'due date', 'end date', 'date'
-        ]
+    def is_date_series(self, series, require_future=True):
+        """Whether most values parse as dates and, unless require_future is
+        False, some lie in the future."""
+        try:
+            temp_series = _fast_to_datetime(series)
+        except Exception:
+            return False
         
-        date_columns = []
+        valid_dates = temp_series.notna().sum()
+        total_values = len(temp_series)
         
+        if total_values > 0 and (valid_dates / total_values) > 0.5:
+            return not require_future or (temp_series > pd.Timestamp.now()).sum() > 0
+        return False
+    
+    def detect_date_columns(self, df):
+        """Detect columns containing expiry dates."""
         # Method 1: Keyword matching
-        for col in df.columns:
-            col_str = str(col).lower()
-            for keyword in date_keywords:
-                if keyword in col_str:
-                    date_columns.append(col)
-                    break
+        date_columns = [col for col in df.columns if self.DATE_RE.search(str(col))]
         
-        # Method 2: Data type analysis if no keywords found
+        # Method 2: Data type analysis if no keywords found; the first rows
+        # screen out text columns before the whole column is converted. Only
+        # the parse rate is sampled, since sheets sorted oldest first may have
+        # no future dates until further down.
         if not date_columns:
-            for col in df.columns:
-                try:
-                    temp_series = pd.to_datetime(df[col], errors='coerce')
-                    valid_dates = temp_series.notna().sum()
-                    total_values = len(temp_series)
-                    
-                    if total_values > 0 and (valid_dates / total_values) > 0.5:
-                        future_dates = (temp_series > pd.Timestamp.now()).sum()
-                        if future_dates > 0:
-                            date_columns.append(col)
-                except Exception:
-                    continue
+            for col in df.select_dtypes(include=['object', 'datetime']).columns:
+                if (self.is_date_series(df[col].head(self.SNIFF_ROWS), require_future=False)
+                        and self.is_date_series(df[col])):
+                    date_columns.append(col)
         
         return date_columns
     
-    def detect_item_column(self, df, date_col):
-        """Detect column containing item names."""
-        item_keywords = ['name', 'item', 'product', 'reagent', 'chemical', 'material', 'description']
-        
-        # Method 1: Keyword matching
-        for col in df.columns:
+    def match_item_column(self, lower_cols, date_col):
+        """Find the item name column by keyword alone."""
+        for col, col_str in lower_cols.items():
             if col == date_col:
                 continue
-            col_str = str(col).lower()
-            for keyword in item_keywords:
+            for keyword in self.ITEM_KEYWORDS:
                 if keyword in col_str:
                     return col
         
+        return None
+    
+    def detect_item_column(self, df, date_col, lower_cols):
+        """Detect column containing item names."""
+        # Method 1: Keyword matching
+        item_col = self.match_item_column(lower_cols, date_col)
+        if item_col is not None:
+            return item_col
+        
         # Method 2: First text column to left of date
         try:
             date_col_idx = df.columns.get_loc(date_col)
@@ -162,144 +365,166 @@ class ExpiryCheckerApp:
         
         return None
     
-    def extract_additional_info(self, row, all_columns, item_col, date_col):
-        """Extract additional information from row."""
-        info = {}
-        
-        additional_keywords = {
-            'lot': ['lot', 'batch', 'lot number', 'batch number'],
-            'catalog': ['catalog', 'cat#', 'cat no', 'catalogue'],
-            'quantity': ['quantity', 'qty', 'amount', 'volume', 'vol'],
-            'location': ['location', 'storage', 'position', 'shelf', 'cabinet'],
-            'supplier': ['supplier', 'vendor', 'manufacturer', 'company']
-        }
+    def detect_info_columns(self, lower_cols, item_col, date_col):
+        """Map columns to the additional info types they hold, once per sheet."""
+        info_columns = []
         
-        for col in all_columns:
+        for col, col_str in lower_cols.items():
             if col == date_col or col == item_col:
                 continue
             
-            col_str = str(col).lower()
-            value = row[col]
-            
-            if pd.notna(value):
-                for info_type, keywords in additional_keywords.items():
-                    for keyword in keywords:
-                        if keyword in col_str:
-                            info[info_type] = str(value)
-                            break
+            for info_type, keywords in self.ADDITIONAL_KEYWORDS.items():
+                for keyword in keywords:
+                    if keyword in col_str:
+                        info_columns.append((col, info_type))
+                        break
         
-        return info
+        return info_columns
+    
+    def extract_additional_info(self, matches, info_columns):
+        """Extract additional information for each matched row."""
+        info_types = [info_type for _, info_type in info_columns]
+        values = matches[[col for col, _ in info_columns]].astype(object).values
+        present = pd.notna(values)
+        return [
+            {info_type: str(value) for info_type, value, found in zip(info_types, row_values, row_present) if found}
+            for row_values, row_present in zip(values, present)
+        ]
+    
+    def extract_item_names(self, matches, item_col, date_col):
+        """Item name per row: the item column, else the first non-empty value."""
+        candidates = [col for col in matches.columns if col != date_col]
+        if item_col is not None:
+            candidates.insert(0, item_col)
+        if not candidates:
+            return ["Unknown Item"] * len(matches)
+        
+        # astype(object) keeps int items from turning into floats next to float columns
+        values = matches[candidates].astype(object).values
+        present = pd.notna(values)
+        first = values[np.arange(len(values)), present.argmax(axis=1)]
+        return [str(value) if found else "Unknown Item" for value, found in zip(first, present.any(axis=1))]
+    
+    def calculate_urgency_levels(self, days_left, warning_days):
+        """Calculate urgency levels for an array of days left."""
+        # Lower bound of each level after 'expired'; kept sorted for short warning periods
+        thresholds = np.array([0, 31, 61, max(warning_days + 1, 61)])
+        codes = np.searchsorted(thresholds, days_left, side='right')
+        return pd.Categorical.from_codes(codes, categories=self.URGENCY_LEVELS, ordered=True)
     
     def calculate_urgency(self, days_left, warning_days):
         """Calculate urgency level."""
-        if days_left < 0:
-            return 'expired'
-        elif days_left <= 30:
-            return 'critical'
-        elif days_left <= 60:
-            return 'urgent'
-        elif days_left <= warning_days:
-            return 'warning'
-        else:
-            return 'info'
+        return self.calculate_urgency_levels([days_left], warning_days)[0]
+    
+    def process_sheet(self, excel_data, file_key, sheet_name, warning_days, today64):
+        """Scan one sheet; returns (match frames, dated rows, counts as processed)."""
+        parts = []
+        total_rows = 0
+        
+        df = _parse_sheet(excel_data, file_key, sheet_name)
+        
+        if df.empty:
+            return parts, total_rows, False
+        
+        # Detect date columns
+        date_columns = self.detect_date_columns(df)
+        
+        # Lowercased names shared by the keyword lookups below
+        lower_cols = {col: str(col).lower() for col in df.columns}
+        
+        # Process each date column
+        for date_col in date_columns:
+            item_col = self.detect_item_column(df, date_col, lower_cols)
+            info_columns = self.detect_info_columns(lower_cols, item_col, date_col)
+            
+            # Convert to datetime
+            df[date_col] = _fast_to_datetime(df[date_col])
+            
+            # Days until expiry for the whole column in one pass
+            dates = df[date_col].values.astype('datetime64[D]')
+            days = (dates - today64).astype('int64')
+            valid = ~np.isnat(dates)
+            mask = valid & (days >= 0) & (days <= warning_days)
+            
+            total_rows += int(valid.sum())
+            
+            # Build the matching rows as one frame per date column
+            matches = df.loc[mask]
+            if matches.empty:
+                continue
+            
+            days_left = days[mask]
+            parts.append(pd.DataFrame({
+                'sheet': sheet_name,
+                'item': self.extract_item_names(matches, item_col, date_col),
+                'expiry_date': matches[date_col].dt.strftime('%Y-%m-%d').values,
+                'days_left': days_left,
+                'urgency': self.calculate_urgency_levels(days_left, warning_days),
+                'additional_info': self.extract_additional_info(matches, info_columns)
+            }))
+        
+        return parts, total_rows, True
     
     def process_excel_file(self, uploaded_file, warning_days, exclude_sheets):
         """Process uploaded Excel file."""
         self.expiring_items = []
+        self._df = pd.DataFrame(columns=self.REPORT_COLUMNS)
+        self.report_key = None
+        self.urgency_counts = {}
         self.stats = {'total_rows': 0, 'sheets_processed': 0, 'items_found': 0}
+        parts = []
         
         try:
-            excel_data = pd.ExcelFile(uploaded_file)
+            file_bytes = uploaded_file.getvalue()
+            file_key = hashlib.md5(file_bytes).hexdigest()
+            excel_data = _open_excel(file_bytes)
             sheet_names = excel_data.sheet_names
             
             today = datetime.now()
-            warning_date = today + timedelta(days=warning_days)
+            today64 = np.datetime64(today.date(), 'D')
             
             progress_bar = st.progress(0)
             status_text = st.empty()
             
+            # Update progress at most ~20 times; each update is a round trip
+            update_every = max(1, len(sheet_names) // 20)
+            
             for idx, sheet_name in enumerate(sheet_names):
                 # Update progress
-                progress = (idx + 1) / len(sheet_names)
-                progress_bar.progress(progress)
-                status_text.text(f"Processing sheet: {sheet_name}")
+                if idx % update_every == 0 or idx == len(sheet_names) - 1:
+                    progress_bar.progress((idx + 1) / len(sheet_names))
+                    status_text.text(f"Processing sheet: {sheet_name}")
                 
                 # Skip excluded sheets
                 if sheet_name in exclude_sheets:
                     continue
                 
                 try:
-                    df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
-                    
-                    if df.empty:
-                        continue
-                    
-                    self.stats['sheets_processed'] += 1
-                    
-                    # Detect date columns
-                    date_columns = self.detect_date_columns(df)
-                    
-                    if not date_columns:
-                        continue
-                    
-                    # Process each date column
-                    for date_col in date_columns:
-                        item_col = self.detect_item_column(df, date_col)
-                        
-                        # Convert to datetime
-                        df[date_col] = pd.to_datetime(df[date_col], errors='coerce')
-                        
-                        # Check each row
-                        for idx, row in df.iterrows():
-                            expiry_date = row[date_col]
-                            
-                            if pd.isna(expiry_date):
-                                continue
-                            
-                            self.stats['total_rows'] += 1
-                            
-                            days_until_expiry = (expiry_date - today).days
-                            
-                            # Check if within warning period
-                            if 0 <= days_until_expiry <= warning_days:
-                                # Get item name
-                                item_name = "Unknown Item"
-                                if item_col and item_col in row.index and pd.notna(row[item_col]):
-                                    item_name = str(row[item_col])
-                                else:
-                                    # Use first non-empty text value
-                                    for col in df.columns:
-                                        if col != date_col and pd.notna(row[col]):
-                                            item_name = str(row[col])
-                                            break
-                                
-                                # Extract additional info
-                                additional_info = self.extract_additional_info(
-                                    row, df.columns, item_col, date_col
-                                )
-                                
-                                item_data = {
-                                    'sheet': sheet_name,
-                                    'item': item_name,
-                                    'expiry_date': expiry_date.strftime('%Y-%m-%d'),
-                                    'days_left': days_until_expiry,
-                                    'urgency': self.calculate_urgency(days_until_expiry, warning_days),
-                                    'additional_info': additional_info
-                                }
-                                
-                                self.expiring_items.append(item_data)
-                                self.stats['items_found'] += 1
-                
+                    sheet_parts, total_rows, processed = self.process_sheet(
+                        excel_data, file_key, sheet_name, warning_days, today64
+                    )
                 except Exception as e:
                     st.warning(f"Error processing sheet '{sheet_name}': {e}")
                     continue
+                
+                parts.extend(sheet_parts)
+                self.stats['total_rows'] += total_rows
+                self.stats['sheets_processed'] += int(processed)
             
+            excel_data.close()
             progress_bar.empty()
             status_text.empty()
             
             # Sort by urgency and days
-            urgency_order = {'expired': 0, 'critical': 1, 'urgent': 2, 'warning': 3, 'info': 4}
-            self.expiring_items.sort(key=lambda x: (urgency_order.get(x['urgency'], 999), x['days_left']))
+            if parts:
+                self._df = pd.concat(parts, ignore_index=True)
+                self._df.sort_values(['urgency', 'days_left'], inplace=True, kind='stable')
+            self.expiring_items = self._df.to_dict('records')
+            self.stats['items_found'] = len(self.expiring_items)
+            self.urgency_counts = self._df['urgency'].value_counts().to_dict()
+            
+            # Identifies this result for the cached report downloads
+            self.report_key = f"{file_key}:{warning_days}:{sorted(exclude_sheets)}:{today64}"
             
             return True
             
@@ -309,7 +534,7 @@ class ExpiryCheckerApp:
     
     def generate_email_html(self, warning_days):
         """Generate HTML email content."""
-        html = f"""
+        parts = [f"""
 <!DOCTYPE html>
 <html>
 <head>
@@ -349,17 +574,10 @@ class ExpiryCheckerApp:
             <th>Expiry Date</th>
             <th>Days Left</th>
         </tr>
-"""
+"""]
         
         for item in self.expiring_items:
             urgency = item['urgency']
-            row_class = f"{urgency}"
-            
-            badge_text = {
-                'critical': '🔴 CRITICAL',
-                'urgent': '🟠 URGENT',
-                'warning': '🟡 WARNING'
-            }
             
             additional_html = ""
             if item['additional_info']:
@@ -367,24 +585,24 @@ class ExpiryCheckerApp:
                 if info_parts:
                     additional_html = f"<br><small>{' • '.join(info_parts)}</small>"
             
-            html += f"""
-        <tr class="{row_class}">
-            <td><span class="badge badge-{urgency}">{badge_text.get(urgency, urgency.upper())}</span></td>
+            parts.append(f"""
+        <tr class="{urgency}">
+            <td><span class="badge badge-{urgency}">{self.BADGE_TEXT.get(urgency, urgency.upper())}</span></td>
             <td><strong>{item['sheet']}</strong></td>
             <td>{item['item']}{additional_html}</td>
             <td>{item['expiry_date']}</td>
             <td><strong>{item['days_left']} days</strong></td>
         </tr>
-"""
+""")
         
-        html += """
+        parts.append("""
     </table>
     <p><em>Please take necessary action to order replacements.</em></p>
     <p><small>Generated by Universal Expiry Monitoring Platform</small></p>
 </body>
 </html>
-"""
-        return html
+""")
+        return ''.join(parts)
     
     def send_email(self, smtp_server, smtp_port, sender_email, sender_password, 
                    recipient_email, warning_days):
@@ -398,11 +616,7 @@ class ExpiryCheckerApp:
             html_body = self.generate_email_html(warning_days)
             msg.attach(MIMEText(html_body, 'html'))
             
-            server = smtplib.SMTP(smtp_server, smtp_port)
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-            server.quit()
+            _send_smtp(msg, smtp_server, smtp_port, sender_email, sender_password)
             
             return True, "Email sent successfully!"
             
@@ -410,16 +624,76 @@ class ExpiryCheckerApp:
             return False, f"Error sending email: {str(e)}"
 
 
-def main():
-    """Main application function."""
-    
-    # Header
-    st.markdown("""
+HEADER_BANNER = """
     <div class="header-banner">
         <h1>🧪 Universal Expiry Date Monitoring Platform</h1>
         <p>Intelligent monitoring system that works with ANY Excel structure</p>
     </div>
-    """, unsafe_allow_html=True)
+    """
+
+WELCOME_CARDS = [
+    f"""
+            <div class="metric-card">
+                <h3>{title}</h3>
+                <p>{text}</p>
+            </div>
+            """
+    for title, text in [
+        ("🎯 Universal", "Works with ANY Excel structure. No modifications needed!"),
+        ("🤖 Intelligent", "Automatically detects dates and item names"),
+        ("📧 Automated", "Professional email alerts with all details")
+    ]
+]
+
+ALERTS_PER_PAGE = 50
+
+ALERT_STYLES = {
+    'critical': ("alert-critical", "🔴", "CRITICAL"),
+    'urgent': ("alert-urgent", "🟠", "URGENT"),
+    'warning': ("alert-warning", "🟡", "WARNING")
+}
+
+@st.fragment
+def render_alerts(items):
+    """Render filtered alert cards one page at a time."""
+    # Filter by urgency
+    urgency_filter = st.multiselect(
+        "Filter by urgency:",
+        ['critical', 'urgent', 'warning'],
+        default=['critical', 'urgent', 'warning']
+    )
+    
+    filtered_items = [item for item in items if item['urgency'] in urgency_filter]
+    
+    # Paginate
+    page_count = max(1, -(-len(filtered_items) // ALERTS_PER_PAGE))
+    page = 1
+    if page_count > 1:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+    start = (page - 1) * ALERTS_PER_PAGE
+    
+    # Display items
+    for item in filtered_items[start:start + ALERTS_PER_PAGE]:
+        alert_class, icon, urgency_text = ALERT_STYLES.get(item['urgency'], ALERT_STYLES['warning'])
+        
+        additional_info = ""
+        if item['additional_info']:
+            info_parts = [f"{k.title()}: {v}" for k, v in item['additional_info'].items()]
+            additional_info = " • " + " • ".join(info_parts)
+        
+        st.markdown(f"""
+        <div class="{alert_class}">
+            <strong>{icon} {urgency_text}</strong> - <strong>{item['item']}</strong> ({item['sheet']})<br>
+            Expires: {item['expiry_date']} ({item['days_left']} days remaining){additional_info}
+        </div>
+        """, unsafe_allow_html=True)
+
+
+def main():
+    """Main application function."""
+    
+    # Header
+    st.markdown(HEADER_BANNER, unsafe_allow_html=True)
     
     # Initialize app
     if 'app' not in st.session_state:
@@ -482,31 +756,9 @@ def main():
     # Main content area
     if uploaded_file is None:
         # Welcome screen
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>🎯 Universal</h3>
-                <p>Works with ANY Excel structure. No modifications needed!</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col2:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>🤖 Intelligent</h3>
-                <p>Automatically detects dates and item names</p>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        with col3:
-            st.markdown("""
-            <div class="metric-card">
-                <h3>📧 Automated</h3>
-                <p>Professional email alerts with all details</p>
-            </div>
-            """, unsafe_allow_html=True)
+        for col, card in zip(st.columns(len(WELCOME_CARDS)), WELCOME_CARDS):
+            with col:
+                st.markdown(card, unsafe_allow_html=True)
         
         st.markdown("---")
         
@@ -571,10 +823,7 @@ def main():
             with col3:
                 st.metric("⚠️ Items Expiring", app.stats['items_found'])
             with col4:
-                urgency_counts = {}
-                for item in app.expiring_items:
-                    urgency_counts[item['urgency']] = urgency_counts.get(item['urgency'], 0) + 1
-                critical_count = urgency_counts.get('critical', 0)
+                critical_count = app.urgency_counts.get('critical', 0)
                 st.metric("🔴 Critical", critical_count)
             
             st.markdown("---")
@@ -583,43 +832,7 @@ def main():
             if app.expiring_items:
                 st.subheader("📋 Expiring Items")
                 
-                # Filter by urgency
-                urgency_filter = st.multiselect(
-                    "Filter by urgency:",
-                    ['critical', 'urgent', 'warning'],
-                    default=['critical', 'urgent', 'warning']
-                )
-                
-                filtered_items = [item for item in app.expiring_items if item['urgency'] in urgency_filter]
-                
-                # Display items
-                for item in filtered_items:
-                    urgency = item['urgency']
-                    
-                    if urgency == 'critical':
-                        alert_class = "alert-critical"
-                        icon = "🔴"
-                        urgency_text = "CRITICAL"
-                    elif urgency == 'urgent':
-                        alert_class = "alert-urgent"
-                        icon = "🟠"
-                        urgency_text = "URGENT"
-                    else:
-                        alert_class = "alert-warning"
-                        icon = "🟡"
-                        urgency_text = "WARNING"
-                    
-                    additional_info = ""
-                    if item['additional_info']:
-                        info_parts = [f"{k.title()}: {v}" for k, v in item['additional_info'].items()]
-                        additional_info = " • " + " • ".join(info_parts)
-                    
-                    st.markdown(f"""
-                    <div class="{alert_class}">
-                        <strong>{icon} {urgency_text}</strong> - <strong>{item['item']}</strong> ({item['sheet']})<br>
-                        Expires: {item['expiry_date']} ({item['days_left']} days remaining){additional_info}
-                    </div>
-                    """, unsafe_allow_html=True)
+                render_alerts(app.expiring_items)
                 
                 st.markdown("---")
                 
@@ -645,13 +858,7 @@ def main():
                 
                 with col2:
                     # Download Excel report
-                    df_report = pd.DataFrame(app.expiring_items)
-                    
-                    output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        df_report.to_excel(writer, index=False, sheet_name='Expiring Items')
-                    
-                    excel_data = output.getvalue()
+                    excel_data = _build_excel_report(app.expiring_items, app.report_key)
                     
                     st.download_button(
                         label="📥 Download Excel Report",
@@ -662,7 +869,7 @@ def main():
                 
                 with col3:
                     # Download CSV report
-                    csv_data = df_report.to_csv(index=False)
+                    csv_data = _build_csv_report(app.expiring_items, app.report_key)
                     
                     st.download_button(
                         label="📄 Download CSV Report",